@@ -1,216 +1,408 @@
 import logging.handlers
 import argparse
+import atexit
 import botocore
-import boto3
+import botocore.config
 import json
-from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+import heapq
+import os
+import queue
+import re
 import sys
+import time
+import urllib.error
+import urllib.request
 
 logging.getLogger('botocore').setLevel(logging.CRITICAL)
 
+# Instance AZs and ASG minimum sizes rarely change between scheduled runs, so
+# they're kept in a small TTL cache on disk (/tmp survives between cron runs
+# and Lambda warm starts)
+CACHE_FILE = '/tmp/ecs_cluster_scaledown_cache.json'
+CACHE_TTL_SECONDS = 900
 
-def _get_instances_in_cluster(cluster_name, next_token=None, status=None):
+
+def _cache_lookup(key):
+    """ Return the cached value for key, or None if missing/expired/unreadable """
+    try:
+        with open(CACHE_FILE) as f:
+            cache = json.load(f)
+        entry = cache.get(key)
+        if entry and time.time() - entry['ts'] < CACHE_TTL_SECONDS:
+            return entry['value']
+    except (IOError, OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def _cache_store(key, value):
+    """ Store a value in the TTL cache - best effort only """
+    try:
+        cache = {}
+        if os.path.exists(CACHE_FILE):
+            with open(CACHE_FILE) as f:
+                cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        cache = {}
+    cache[key] = {'ts': time.time(), 'value': value}
+    try:
+        with open(CACHE_FILE, 'w') as f:
+            json.dump(cache, f)
+    except (IOError, OSError):
+        pass
+
+
+def _get_instances_in_cluster(cluster_name, status=None):
     """Get instances in the given cluster"""
+    paginator = ECS.get_paginator('list_container_instances')
+    kwargs = {'cluster': cluster_name}
+    if status:
+        kwargs['status'] = status
     result = []
-    if next_token:
-        if status:
-            query_result = ECS.list_container_instances(cluster=cluster_name, nextToken=next_token, status=status)
-        else:
-            query_result = ECS.list_container_instances(cluster=cluster_name, nextToken=next_token)
-    else:
-        if status:
-            query_result = ECS.list_container_instances(cluster=cluster_name, status=status)
-        else:
-            query_result = ECS.list_container_instances(cluster=cluster_name)
-    if 'ResponseMetadata' in query_result:
-        if 'HTTPStatusCode' in query_result['ResponseMetadata']:
-            if query_result['ResponseMetadata']['HTTPStatusCode'] == 200:
-                if 'nextToken' in query_result:
-                    result.extend(query_result['containerInstanceArns'])
-                    result.extend(_get_instances_in_cluster(cluster_name=cluster_name,
-                                                            next_token=query_result['nextToken'],
-                                                            status=status))
-                else:
-                    result.extend(query_result['containerInstanceArns'])
+    # Full 100-item pages - fewer round-trips than the default page size
+    for page in paginator.paginate(PaginationConfig={'PageSize': 100}, **kwargs):
+        result.extend(page['containerInstanceArns'])
     return result
 
 
-def _get_instance_id(cluster_name, container_instance_id):
+def _any_instance_with_status(cluster_name, status):
+    """ Cheap existence check - one call returning at most one ARN, no pagination """
+    query_result = ECS.list_container_instances(cluster=cluster_name, status=status, maxResults=1)
+    return bool(query_result.get('containerInstanceArns'))
+
+
+@lru_cache(maxsize=2048)
+def _describe_container_instance(cluster_name, container_instance_id):
+    """ Describe a single container instance - memoized since the same instance
+    can be looked at several times within one run """
     query_result = ECS.describe_container_instances(cluster=cluster_name, containerInstances=[container_instance_id])
-    instance_id = None
-    if 'containerInstances' in query_result:
-        instance_id = query_result['containerInstances'][0]['ec2InstanceId']
-    return instance_id
+    container_instances = query_result.get('containerInstances', [])
+    if not container_instances:
+        return None
+    return container_instances[0]
+
+
+def _get_instance_id(cluster_name, container_instance_id):
+    container_instance = _describe_container_instance(cluster_name, container_instance_id)
+    if not container_instance:
+        return None
+    return container_instance['ec2InstanceId']
+
+
+IMDS_BASE_URL = 'http://169.254.169.254/latest'
 
 
-def _get_instance_az(instance_id):
-    query_result = EC2.describe_instances(InstanceIds=[instance_id])
-    az = None
-    if 'Reservations' in query_result:
-        if 'Instances' in query_result['Reservations'][0]:
-            az = query_result['Reservations'][0]['Instances'][0]['Placement']['AvailabilityZone']
-    return az
+@lru_cache(maxsize=1)
+def _get_imds_token():
+    """ Get an IMDSv2 session token - returns None when not running on EC2 """
+    try:
+        request = urllib.request.Request(IMDS_BASE_URL + '/api/token',
+                                         headers={'X-aws-ec2-metadata-token-ttl-seconds': '21600'},
+                                         method='PUT')
+        with urllib.request.urlopen(request, timeout=1) as response:
+            return response.read().decode()
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def _imds_lookup(path):
+    """ Read a value from the EC2 instance metadata service, or None """
+    token = _get_imds_token()
+    if not token:
+        return None
+    try:
+        request = urllib.request.Request('%s/meta-data/%s' % (IMDS_BASE_URL, path),
+                                         headers={'X-aws-ec2-metadata-token': token})
+        with urllib.request.urlopen(request, timeout=1) as response:
+            return response.read().decode()
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+@lru_cache(maxsize=1)
+def _get_local_instance_id():
+    return _imds_lookup('instance-id')
 
 
 def _get_container_instance_id(cluster_name, instance_id):
-    query_result = ECS.list_container_instances(cluster=cluster_name)
-    container_instance_id = None
-    for ci in query_result['containerInstanceArns']:
-        if _get_instance_id(cluster_name, ci) == instance_id:
-            container_instance_id = ci
-    return container_instance_id
+    arns = _get_instances_in_cluster(cluster_name)
+    for chunk in _chunks(arns, 100):
+        query_result = ECS.describe_container_instances(cluster=cluster_name, containerInstances=chunk)
+        for ci in query_result['containerInstances']:
+            if ci['ec2InstanceId'] == instance_id:
+                return ci['containerInstanceArn']
+    return None
 
 
+@lru_cache(maxsize=2048)
 def _get_autoscaling_group_name(instance_id):
-    EC2 = SESSION.client('ec2')
-    asg_name = None
-    query_result = EC2.describe_instances(InstanceIds=[instance_id])
-    if 'Reservations' in query_result and 'Instances' in query_result['Reservations'][0]:
-        instance_tags = query_result['Reservations'][0]['Instances'][0]['Tags']
-        try:
-            asg_name = [d['Value'] for d in instance_tags if d['Key'] == 'aws:autoscaling:groupName'][0]
-        except:
-            pass
-    return asg_name
+    # If we're asking about the instance this script runs on, the metadata
+    # service answers locally with no API quota cost - needs instance tags
+    # enabled in metadata, so fall through to the API if absent
+    if instance_id == _get_local_instance_id():
+        asg_name = _imds_lookup('tags/instance/aws:autoscaling:groupName')
+        if asg_name:
+            return asg_name
+    # describe_auto_scaling_instances returns the group name directly - a far
+    # smaller response than describe_instances with the full reservation just
+    # to dig the aws:autoscaling:groupName tag out
+    query_result = ASG.describe_auto_scaling_instances(InstanceIds=[instance_id])
+    instances = query_result.get('AutoScalingInstances', [])
+    if not instances:
+        return None
+    return instances[0]['AutoScalingGroupName']
 
 
+@lru_cache(maxsize=2048)
 def _get_autoscaling_group_min_size(autoscaling_group_name):
+    min_size = _cache_lookup('asg_min_size:%s' % autoscaling_group_name)
+    if min_size is not None:
+        return min_size
     query_result = ASG.describe_auto_scaling_groups(AutoScalingGroupNames=[autoscaling_group_name])
-    if 'AutoScalingGroups' in query_result:
-        return query_result['AutoScalingGroups'][0]['MinSize']
-    else:
+    groups = query_result.get('AutoScalingGroups', [])
+    if not groups:
         return None
+    min_size = groups[0]['MinSize']
+    _cache_store('asg_min_size:%s' % autoscaling_group_name, min_size)
+    return min_size
 
 
-def _get_instance_task_count(cluster_name, container_instance_id):
-    number_of_tasks = 0
-    task_list_query_result = ECS.list_tasks(cluster=cluster_name, containerInstance=container_instance_id)
-    if 'taskArns' in task_list_query_result:
-        number_of_tasks = len(task_list_query_result['taskArns'])
-    return number_of_tasks
+def _chunks(item_list, chunk_size):
+    """ Yield successive chunk_size-sized slices from the given list """
+    for i in range(0, len(item_list), chunk_size):
+        yield item_list[i:i + chunk_size]
 
 
-def _get_sorted_instance_list_with_info(cluster_name):
-    ''' Return a list of instance objects in the cluster, ordered by number of tasks running on each '''
+def _reservation_score(container_instance):
+    """
+    Fraction of the instance's registered CPU/memory currently reserved,
+    0.0 (idle) to 1.0 (full) - computed from fields describe_container_instances
+    already returns, so it costs no extra API calls
+    """
+    registered = {r['name']: r.get('integerValue') or r.get('doubleValue') or 0
+                  for r in container_instance.get('registeredResources', [])}
+    remaining = {r['name']: r.get('integerValue') or r.get('doubleValue') or 0
+                 for r in container_instance.get('remainingResources', [])}
+    fractions = []
+    for resource_name in ('CPU', 'MEMORY'):
+        total = registered.get(resource_name)
+        if total:
+            fractions.append(1 - remaining.get(resource_name, 0) / total)
+    if not fractions:
+        return 0.0
+    return sum(fractions) / len(fractions)
+
+
+def _describe_in_parallel(describe_fn, list_kwarg, items, result_key, chunk_size=100, **kwargs):
+    """
+    Call a batched describe API over chunks of items (the APIs cap out at 100
+    per call), firing the chunks concurrently, and merge the results
+    """
+    chunk_list = list(_chunks(items, chunk_size))
+    if not chunk_list:
+        return []
+    results = []
+    with ThreadPoolExecutor(max_workers=min(8, len(chunk_list))) as executor:
+        futures = [executor.submit(describe_fn, **dict(kwargs, **{list_kwarg: chunk}))
+                   for chunk in chunk_list]
+        for future in as_completed(futures):
+            results.extend(future.result()[result_key])
+    return results
+
+
+def _get_sorted_instance_list_with_info(cluster_name, k=None):
+    '''
+    Return a list of instance objects in the cluster, ordered by number of
+    tasks running on each. If k is given, only the k least loaded instances
+    are returned (heapq.nsmallest is O(N log k) instead of a full sort).
+    '''
     cluster_instance_list = _get_instances_in_cluster(cluster_name, status='ACTIVE')
-    unsorted_instance_list = []
-    for instance in cluster_instance_list:
-        number_of_tasks = _get_instance_task_count(cluster_name, instance)
-        instance_id = _get_instance_id(cluster_name, instance)
-        instance_az = _get_instance_az(instance_id)
-        item = {
+
+    # Describe the container instances in batches of 100 (the API max) rather
+    # than one call per instance
+    container_instances = _describe_in_parallel(ECS.describe_container_instances, 'containerInstances',
+                                                cluster_instance_list, 'containerInstances',
+                                                cluster=cluster_name)
+    ec2_instance_ids = {ci['containerInstanceArn']: ci['ec2InstanceId'] for ci in container_instances}
+
+    # Batched describe_instances for all the AZs instead of one per instance.
+    # An instance's AZ never changes, so the disk cache answers repeat runs
+    # and only the misses get described
+    instance_azs = {}
+    az_misses = []
+    for instance_id in ec2_instance_ids.values():
+        az = _cache_lookup('az:%s' % instance_id)
+        if az:
+            instance_azs[instance_id] = az
+        else:
+            az_misses.append(instance_id)
+    for reservation in _describe_in_parallel(EC2.describe_instances, 'InstanceIds',
+                                             az_misses, 'Reservations'):
+        for ec2_instance in reservation['Instances']:
+            az = ec2_instance['Placement']['AvailabilityZone']
+            instance_azs[ec2_instance['InstanceId']] = az
+            _cache_store('az:%s' % ec2_instance['InstanceId'], az)
+
+    # runningTasksCount comes back on the batched describe above, so there's
+    # no per-instance list_tasks round-trip needed at all
+    task_counts = {ci['containerInstanceArn']: ci['runningTasksCount'] for ci in container_instances}
+    # Break task-count ties by CPU/memory reservation so that between two
+    # instances with the same number of tasks, the emptier one drains first
+    reservation_scores = {ci['containerInstanceArn']: _reservation_score(ci) for ci in container_instances}
+
+    # Order plain (count, score, arn) tuples - tuple comparisons run at C speed
+    # with no per-compare key extraction - and only build dicts for what we return
+    count_pairs = [(task_counts.get(arn, 0), reservation_scores.get(arn, 0.0), arn)
+                   for arn in cluster_instance_list]
+    if k is not None:
+        count_pairs = heapq.nsmallest(k, count_pairs)
+    else:
+        count_pairs.sort()
+
+    sorted_instance_list = []
+    for number_of_tasks, _, instance in count_pairs:
+        instance_id = ec2_instance_ids.get(instance)
+        sorted_instance_list.append({
             'container_instance_id': instance,
-            'az': instance_az,
+            'ec2_instance_id': instance_id,
+            'az': instance_azs.get(instance_id),
             'task_count': number_of_tasks
-        }
-        unsorted_instance_list.append(item)
-    sorted_instance_list = sorted(unsorted_instance_list, key=itemgetter('task_count'))
+        })
     return sorted_instance_list
 
 
 def _start_draining_instances(cluster_name, container_instance_id_list, dryrun=False):
     """ Put the given instance in a draining state """
-    logging.debug("Attempting to put the following container instances in a DRAINING state: %s" % str(container_instance_id_list))
+    logging.debug("Attempting to put the following container instances in a DRAINING state: %s", container_instance_id_list)
     if not dryrun:
         try:
-            action_result = ECS.update_container_instances_state(cluster=cluster_name,
-                                                                 containerInstances=container_instance_id_list,
-                                                                 status='DRAINING')
-            if 'ResponseMetadata' in action_result:
-                if 'HTTPStatusCode' in action_result['ResponseMetadata']:
-                    if action_result['ResponseMetadata']['HTTPStatusCode'] != 200:
-                        logging.error("Unexpected HTTPStatusCode - Unable to put instances in DRAINING state")
-                        return False
-                else:
-                    logging.error("No HTTPStatusCode in response - Unable to put instances in DRAINING state")
-                    return False
-            else:
-                logging.error("No ResponseMetaData in response - Unable to put instances in DRAINING state")
-                return False
+            # The API caps containerInstances at 10 per call - chunk the list
+            # and fire the chunks concurrently, then aggregate the failures
+            chunk_list = list(_chunks(container_instance_id_list, 10))
+            failures = []
+            with ThreadPoolExecutor(max_workers=min(8, len(chunk_list))) as executor:
+                # botocore raises ClientError on non-2xx responses so there's
+                # no need to inspect ResponseMetadata here
+                futures = [executor.submit(ECS.update_container_instances_state,
+                                           cluster=cluster_name,
+                                           containerInstances=chunk,
+                                           status='DRAINING')
+                           for chunk in chunk_list]
+                for future in as_completed(futures):
+                    failures.extend(future.result().get('failures', []))
             # TODO: Check containerInstances returned and verify instances in question are in DRAINING state
             # If failures list is > 0, print out errors
-            if len(action_result['failures']) > 0:
-                for inst in action_result['failures']:
-                    logging.error("Failure putting container instance into DRAINING state: %s" % inst)
+            if failures:
+                for inst in failures:
+                    logging.error("Failure putting container instance into DRAINING state: %s", inst)
                 return False
             else:
                 return True
         except botocore.exceptions.ClientError as e:
-            logging.error('Unexpected error: %s' % e)
+            logging.error('Unexpected error: %s', e)
     else:
         logging.warning("   Dryrun selected - will NOT put instances into DRAINING state")
 
 
-def _get_instance_tasks(cluster_name, container_instance_id, next_token=None):
+def _get_instance_tasks(cluster_name, container_instance_id):
     """ Get a list of tasks running for the given instance """
+    paginator = ECS.get_paginator('list_tasks')
     result = []
-    if next_token:
-        query_result = ECS.list_tasks(cluster=cluster_name, containerInstance=container_instance_id, nextToken=next_token)
-    else:
-        query_result = ECS.list_tasks(cluster=cluster_name, containerInstance=container_instance_id)
-    if 'ResponseMetadata' in query_result:
-        if 'HTTPStatusCode' in query_result['ResponseMetadata']:
-            if query_result['ResponseMetadata']['HTTPStatusCode'] == 200:
-                if 'nextToken' in query_result:
-                    result.extend(query_result['taskArns'])
-                    result.extend(_get_instance_tasks(cluster_name=cluster_name,
-                                                      containerInstance=container_instance_id,
-                                                      next_token=query_result['nextToken']))
-                else:
-                    result.extend(query_result['taskArns'])
+    for page in paginator.paginate(cluster=cluster_name, containerInstance=container_instance_id,
+                                   PaginationConfig={'PageSize': 100}):
+        result.extend(page['taskArns'])
     return result
 
 
-def _can_be_terminated(cluster_name, container_instance_id, ignore_list=[]):
+def _snapshot_instance_tasks(cluster_name, container_instance_ids):
+    """
+    Get details of the tasks on the given container instances, keyed by
+    instance: one threaded list_tasks per instance to collect the ARNs, then
+    batched describe_tasks calls (100 per call) over all of them together, so
+    per-instance termination checks can be answered from memory
+    """
+    if not container_instance_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(16, len(container_instance_ids))) as executor:
+        task_lists = list(executor.map(lambda ci: _get_instance_tasks(cluster_name, ci),
+                                       container_instance_ids))
+    task_arns = [arn for arns in task_lists for arn in arns]
+    snapshot = {instance_arn: [] for instance_arn in container_instance_ids}
+    for task in _describe_in_parallel(ECS.describe_tasks, 'tasks', task_arns, 'tasks',
+                                      cluster=cluster_name):
+        instance_arn = task.get('containerInstanceArn')
+        if instance_arn in snapshot:
+            snapshot[instance_arn].append(task)
+    return snapshot
+
+
+def _can_be_terminated(cluster_name, container_instance_id, ignore_list=[], task_snapshot=None, ci_info=None):
     """
     Determine if the given instance can be terminated
     An instance is deemed ready for termination if no tasks are running on it, or
     only tasks matching the ignore_list are left running on it
+    Callers that already hold the describe_container_instances record pass it
+    as ci_info so the entry check can be answered from runningTasksCount
+    without a list_tasks call
     """
-    task_count = _get_instance_task_count(cluster_name, container_instance_id)
-    if task_count == 0:
+    if ci_info is not None:
+        running_count = ci_info['runningTasksCount']
+        if running_count == 0:
+            logging.debug("No tasks running on this instance - can be terminated")
+            return True
+        if running_count > len(ignore_list):
+            logging.warning("%s: Too many tasks on this instance - can NOT be terminated", cluster_name)
+            return False
+    if task_snapshot is not None:
+        # Evaluate against the in-memory snapshot - no API calls needed
+        described_tasks = task_snapshot.get(container_instance_id, [])
+        task_list = described_tasks
+    else:
+        task_list = _get_instance_tasks(cluster_name, container_instance_id)
+    if len(task_list) == 0:
         logging.debug("No tasks running on this instance - can be terminated")
         return True
-    elif task_count <= len(ignore_list):
-        # There are the same number of tasks as the length of the ignore list - check them
-        logging.debug("%s: Number of tasks running on this instance equals the length of the ignore list - check tasks to see if they match" % cluster_name)
-        task_list = _get_instance_tasks(cluster_name, container_instance_id)
-        # Double check number of tasks
-        if len(task_list) > len(ignore_list):
-            # Too many tasks
-            return False
-        else:
-            query_result = ECS.describe_tasks(cluster=cluster_name,
-                                              tasks=task_list)
-            running_tasks = query_result['tasks']
-            for task in list(running_tasks):
-                for ignore in ignore_list:
-                    if ignore in task['group']:
-                        logging.debug('   Found %s task - ignoring' % ignore)
-                        running_tasks.remove(task)
-                        break
-            # running_tasks should be zero at this point if we can terminate this instance
-            if len(running_tasks) == 0:
-                logging.debug("%s: All tasks running on this instance in ignore list - can be terminated" % cluster_name)
-                return True
+    elif len(task_list) <= len(ignore_list):
+        # There are no more tasks than entries in the ignore list - check them
+        logging.debug("%s: Number of tasks running on this instance within the length of the ignore list - check tasks to see if they match", cluster_name)
+        if task_snapshot is None:
+            described_tasks = _describe_in_parallel(ECS.describe_tasks, 'tasks', task_list, 'tasks',
+                                                    cluster=cluster_name)
+        # One compiled alternation gives a single scan per group string,
+        # instead of a substring pass per ignore-list entry per task
+        ignore_pattern = re.compile('|'.join(re.escape(ignore) for ignore in ignore_list))
+        running_tasks = [task for task in described_tasks
+                         if not ignore_pattern.search(task['group'])]
+        # running_tasks should be zero at this point if we can terminate this instance
+        if len(running_tasks) == 0:
+            logging.debug("%s: All tasks running on this instance in ignore list - can be terminated", cluster_name)
+            return True
+        return False
     else:
         # too many tasks
-        logging.warning("%s: Too many tasks on this instance - can NOT be terminated" % cluster_name)
+        logging.warning("%s: Too many tasks on this instance - can NOT be terminated", cluster_name)
         return False
 
 
-def _terminate_and_remove_from_autoscaling_group(cluster_name, container_instance_id, dryrun=False):
+def _terminate_and_remove_from_autoscaling_group(cluster_name, container_instance_id, ec2_instance_id=None, dryrun=False):
     """ Terminate the given instance and remove it from the autoscaling group while decrementing the desired count """
     result = None
     try:
-        query_result = ECS.describe_container_instances(cluster=cluster_name, containerInstances=[container_instance_id])
         result = '%s: Scheduled termination result for container instance %s: ' % (cluster_name, container_instance_id)
-        if 'containerInstances' in query_result:
-            instance_id = query_result['containerInstances'][0]['ec2InstanceId']
-            container_instance_state = query_result['containerInstances'][0]['status']
-            logging.debug("%s: Instance %s to be terminated - currently in %s state" % (cluster_name, instance_id, container_instance_state))
-            if not 'DRAINING' in container_instance_state:
-                logging.warning("%s: Container Instance not in DRAINING state - unexpected, but continuing anyway" % cluster_name)
+        # Callers that already resolved the EC2 instance id pass it in so we
+        # don't have to describe the container instance again
+        instance_id = ec2_instance_id
+        if not instance_id:
+            container_instance = _describe_container_instance(cluster_name, container_instance_id)
+            if container_instance:
+                instance_id = container_instance['ec2InstanceId']
+                container_instance_state = container_instance['status']
+                logging.debug("%s: Instance %s to be terminated - currently in %s state", cluster_name, instance_id, container_instance_state)
+                if not 'DRAINING' in container_instance_state:
+                    logging.warning("%s: Container Instance not in DRAINING state - unexpected, but continuing anyway", cluster_name)
+        if instance_id:
             if not dryrun:
                 activity_result = ASG.terminate_instance_in_auto_scaling_group(InstanceId=instance_id,
                                                                                ShouldDecrementDesiredCapacity=True)
@@ -220,25 +412,67 @@ def _terminate_and_remove_from_autoscaling_group(cluster_name, container_instanc
                 result += "Successfully terminated and removed %s - dryrun" % instance_id
     except botocore.exceptions.ClientError as e:
         result += 'Unexpected error: %s' % e
-        logging.error('Unexpected error: %s' % e)
+        logging.error('Unexpected error: %s', e)
     return result
 
 
-def remove_container_instance_from_ecs_cluster(cluster_name, container_instance_id, ignore_list=[], dryrun=False):
-    logging.info("%s: Attempting to remove container instance with ID %s from cluster" % (cluster_name, container_instance_id))
+def _terminate_and_remove_batch(cluster_name, instance_ids, autoscaling_group_name, dryrun=False):
+    """
+    Detach instances from the autoscaling group in calls of 20 (the API max),
+    decrementing the desired count, and terminate each batch as soon as it
+    detaches - a failure part way through never leaves already-detached
+    instances running outside the group
+    """
+    if dryrun:
+        logging.warning("Dryrun selected - no modifications will be done")
+        return
+    for chunk in _chunks(instance_ids, 20):
+        try:
+            ASG.detach_instances(InstanceIds=chunk,
+                                 AutoScalingGroupName=autoscaling_group_name,
+                                 ShouldDecrementDesiredCapacity=True)
+        except botocore.exceptions.ClientError as e:
+            logging.error('Unexpected error detaching %s: %s', chunk, e)
+            continue
+        try:
+            EC2.terminate_instances(InstanceIds=chunk)
+        except botocore.exceptions.ClientError as e:
+            logging.error('Unexpected error terminating detached instances %s: %s', chunk, e)
+            continue
+        logging.info("%s: Detached and terminated %s instance(s): %s", cluster_name, len(chunk), chunk)
+
+
+def remove_container_instance_from_ecs_cluster(cluster_name, container_instance_id, ignore_list=[], dryrun=False,
+                                               draining_set=None, ec2_instance_id=None, task_snapshot=None):
+    logging.info("%s: Attempting to remove container instance with ID %s from cluster", cluster_name, container_instance_id)
+
+    # Callers looking up by EC2 instance ID pass None through when the
+    # instance isn't registered in the cluster
+    if container_instance_id is None:
+        logging.error("%s: No container instance found in cluster - aborting", cluster_name)
+        return False
 
     if not dryrun:
         # Make sure instance in question is in DRAINING state before continuing
-        if not container_instance_id in _get_instances_in_cluster(cluster_name, status='DRAINING'):
-            logging.error("%s: Container Instance %s not in DRAINING state - aborting" % (cluster_name, container_instance_id))
+        # Callers removing several instances pass the DRAINING set in so we
+        # don't re-list the cluster for every instance; otherwise the status
+        # on a single describe answers it without a paginated list walk
+        if draining_set is None:
+            container_instance = _describe_container_instance(cluster_name, container_instance_id)
+            in_draining_state = container_instance is not None and container_instance['status'] == 'DRAINING'
+        else:
+            in_draining_state = container_instance_id in draining_set
+        if not in_draining_state:
+            logging.error("%s: Container Instance %s not in DRAINING state - aborting", cluster_name, container_instance_id)
             return False
 
-        if _can_be_terminated(cluster_name, container_instance_id, ignore_list):
-            result = _terminate_and_remove_from_autoscaling_group(cluster_name, container_instance_id, dryrun)
+        if _can_be_terminated(cluster_name, container_instance_id, ignore_list, task_snapshot=task_snapshot):
+            result = _terminate_and_remove_from_autoscaling_group(cluster_name, container_instance_id,
+                                                                  ec2_instance_id=ec2_instance_id, dryrun=dryrun)
             logging.info(result)
             return True
         else:
-            logging.info("%s: Container Instance %s not ready to be terminated - will try again later" % (cluster_name, container_instance_id))
+            logging.info("%s: Container Instance %s not ready to be terminated - will try again later", cluster_name, container_instance_id)
             return False
     else:
         logging.warning("   Dryrun selected - don't terminate and remove...")
@@ -246,7 +480,7 @@ def remove_container_instance_from_ecs_cluster(cluster_name, container_instance_
 
 
 def remove_instance_from_ecs_cluster_by_instance_id(cluster_name, instance_id, ignore_list=[], dryrun=False):
-    logging.info("%s: Asked to remove instance with ID %s from cluster" % (cluster_name, instance_id))
+    logging.info("%s: Asked to remove instance with ID %s from cluster", cluster_name, instance_id)
     container_instance_id = _get_container_instance_id(cluster_name, instance_id)
     return remove_container_instance_from_ecs_cluster(cluster_name=cluster_name,
                                                       container_instance_id=container_instance_id,
@@ -254,27 +488,34 @@ def remove_instance_from_ecs_cluster_by_instance_id(cluster_name, instance_id, i
                                                       dryrun=dryrun)
 
 
-def scale_down_ecs_cluster(decrease_count, cluster_name=None, ignore_list=[], dryrun=False):
+def scale_down_ecs_cluster(decrease_count, cluster_name=None, ignore_list=[], dryrun=False, drain_wait=0):
     """
     Scale down the given ECS cluster by the count given
     :param decrease_count: number of instances to remove from cluster
     :param cluster_name: name of the cluster to scale down
     :param ignore_list: list of tasks to ignore
     :param dryrun: dryrun only - no changes
+    :param drain_wait: seconds to keep retrying instances that haven't drained yet
     :return: Boolean Success
     """
     if not cluster_name:
         logging.critical("Must provide cluster name")
-    logging.info("%s: Asked to scale down cluster by a count of %s" % (cluster_name, str(decrease_count)))
+    # Instance/AZ/ASG info doesn't change during a run but can go stale between
+    # runs in a long-lived process - start each scale down with fresh caches
+    _describe_container_instance.cache_clear()
+    _get_autoscaling_group_name.cache_clear()
+    _get_autoscaling_group_min_size.cache_clear()
+    logging.info("%s: Asked to scale down cluster by a count of %s", cluster_name, decrease_count)
     # Get an ordered list of instances in the cluster
     ordered_instances = _get_sorted_instance_list_with_info(cluster_name=cluster_name)
     container_instance_list = []
     for instance in ordered_instances:
         container_instance_list.append(instance['container_instance_id'])
-    logging.debug("%s: Cluster instance list:\n%s" % (cluster_name, json.dumps(ordered_instances, indent=4)))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("%s: Cluster instance list:\n%s", cluster_name, json.dumps(ordered_instances, indent=4))
     instance_count = len(container_instance_list)
     if instance_count <= 0:
-        logging.error("%s: No instances in cluster! Aborting" % cluster_name)
+        logging.error("%s: No instances in cluster! Aborting", cluster_name)
         return False
 
     # Query an instance in the cluster for the Autoscaling Group Name
@@ -282,26 +523,26 @@ def scale_down_ecs_cluster(decrease_count, cluster_name=None, ignore_list=[], dr
     asg_name = _get_autoscaling_group_name(instance_to_query)
     if asg_name:
         min_cluster_size = int(_get_autoscaling_group_min_size(asg_name))
-        logging.info("%s: Determined minimum cluster size to be %s" % (cluster_name, str(min_cluster_size)))
+        logging.info("%s: Determined minimum cluster size to be %s", cluster_name, min_cluster_size)
     else:
-        logging.warning("%s: Unable to determine minimum cluster size, defaulting to 1" % cluster_name)
+        logging.warning("%s: Unable to determine minimum cluster size, defaulting to 1", cluster_name)
         min_cluster_size = 1
 
     if instance_count <= min_cluster_size:
-        logging.error("%s: Cluster is already at or below minimum size - unable to scale down further - aborting" % cluster_name)
+        logging.error("%s: Cluster is already at or below minimum size - unable to scale down further - aborting", cluster_name)
         return False
 
     if instance_count - decrease_count < min_cluster_size:
         # need to recalculate decrease_count
-        logging.warning("%s: Decreasing cluster by the given count, %s, would result in cluster dropping below minimum size" % (cluster_name, str(decrease_count)))
+        logging.warning("%s: Decreasing cluster by the given count, %s, would result in cluster dropping below minimum size", cluster_name, decrease_count)
         decrease_count = instance_count - min_cluster_size
-        logging.warning("%s: Cluster min size is %s, current size is %s, can decrease by a maximum of %s" % (cluster_name, min_cluster_size, instance_count, decrease_count))
+        logging.warning("%s: Cluster min size is %s, current size is %s, can decrease by a maximum of %s", cluster_name, min_cluster_size, instance_count, decrease_count)
 
     if decrease_count <= 0:
-        logging.error("%s: Not enough instances in cluster to reduce size" % cluster_name)
+        logging.error("%s: Not enough instances in cluster to reduce size", cluster_name)
         return False
 
-    logging.info("%s: Current cluster size: %s" % (cluster_name, str(instance_count)))
+    logging.info("%s: Current cluster size: %s", cluster_name, instance_count)
 
     # Determine number of instances in each az
     azs = {}
@@ -311,50 +552,117 @@ def scale_down_ecs_cluster(decrease_count, cluster_name=None, ignore_list=[], dr
             azs[az_name] = []
         azs[az_name].append(instance['container_instance_id'])
 
-    logging.debug("AZ dict:\n%s" % json.dumps(azs, indent=4))
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug("AZ dict:\n%s", json.dumps(azs, indent=4))
 
     for az in azs:
-        logging.info("   Count in %s: %s" % (az, len(azs[az])))
+        logging.info("   Count in %s: %s", az, len(azs[az]))
 
+    # Always take the next instance from the AZ with the most instances left so
+    # the zones stay balanced - a max-heap on AZ size handles any number of AZs
     terminate_list = []
-    # Only handle 2 AZs for now
-    if len(azs) == 1:
-        # only one availability zone in use - just remove the top entry
-        logging.debug('%s: Only one availability zone in play - select the least loaded instance' % cluster_name)
-        terminate_list = container_instance_list[:decrease_count]
-    elif len(azs) == 2:
-        az_names = []
-        for az in azs:
-            az_names.append(az)
-        for x in range(0,decrease_count):
-            # two availability zones in use
-            if len(azs[az_names[0]]) > len(azs[az_names[1]]) or len(azs[az_names[0]]) == len(azs[az_names[1]]):
-                # first group is greater than or equal to the second group - first take from group 1
-                instance_to_terminate = azs[az_names[0]].pop(0)
-                logging.debug('%s: Selecting instance from AZ: %s' % (cluster_name, az_names[0]))
-                terminate_list.append(instance_to_terminate)
-            else:
-                # first group is smaller than the second group - first take from group 2
-                instance_to_terminate = azs[az_names[1]].pop(0)
-                logging.debug('%s: Selecting instance from AZ: %s' % (cluster_name, az_names[1]))
-                terminate_list.append(instance_to_terminate)
-    else:
-        logging.error("%s: Can't handle more than 2 availability zones currently" % cluster_name)
-        sys.exit(1)
-
-    logging.debug("%s: Terminate instance list: %s" % (cluster_name, str(terminate_list)))
+    az_heap = [(-len(instances), az, instances) for az, instances in azs.items()]
+    heapq.heapify(az_heap)
+    for x in range(0, decrease_count):
+        size, az, instances = heapq.heappop(az_heap)
+        logging.debug('%s: Selecting instance from AZ: %s', cluster_name, az)
+        terminate_list.append(instances.pop(0))
+        if instances:
+            heapq.heappush(az_heap, (-len(instances), az, instances))
+
+    logging.debug("%s: Terminate instance list: %s", cluster_name, terminate_list)
     # Drain the least loaded instances
     _start_draining_instances(cluster_name, terminate_list, dryrun)
 
-    for inst in terminate_list[:]:
-        remove_container_instance_from_ecs_cluster(cluster_name=args.cluster_name,
-                                                   container_instance_id=inst,
-                                                   ignore_list=ignore_list,
-                                                   dryrun=args.dryrun)
+    # The sorted instance info already knows each EC2 instance id - pass it
+    # down so the terminate path doesn't have to look it up again
+    ec2_ids_by_arn = {instance['container_instance_id']: instance['ec2_instance_id']
+                      for instance in ordered_instances}
+
+    # Attempt the removals, retrying with exponential backoff (rather than a
+    # fixed poll interval) for up to drain_wait seconds. The default of 0
+    # keeps the original behavior: one attempt, anything still draining gets
+    # picked up on a later scheduled run.
+    pending = list(terminate_list)
+    backoff = 5
+    # monotonic() can't jump backwards/forwards with wall-clock adjustments
+    deadline = time.monotonic() + drain_wait
+    while pending:
+        # One batched describe answers both questions for the whole pending
+        # list in a single tick: status says whether the drain request took,
+        # runningTasksCount says whether the instance has emptied out
+        ci_info = {ci['containerInstanceArn']: ci
+                   for ci in _describe_in_parallel(ECS.describe_container_instances, 'containerInstances',
+                                                   pending, 'containerInstances', cluster=cluster_name)}
+
+        # Task details are only needed for instances whose leftover tasks
+        # might all be on the ignore list - build the snapshot lazily
+        task_snapshot = None
+
+        # Work out which instances are ready purely in memory, then detach and
+        # terminate the whole ready batch in bulk
+        ready = []
+        still_pending = []
+        for inst in pending:
+            logging.info("%s: Attempting to remove container instance with ID %s from cluster", cluster_name, inst)
+            if dryrun:
+                logging.warning("   Dryrun selected - don't terminate and remove...")
+                continue
+            info = ci_info.get(inst)
+            if not info or info['status'] != 'DRAINING':
+                logging.error("%s: Container Instance %s not in DRAINING state - skipping", cluster_name, inst)
+                still_pending.append(inst)
+                continue
+            if task_snapshot is None and ignore_list and 0 < info['runningTasksCount'] <= len(ignore_list):
+                # One task snapshot covering every instance that needs the
+                # ignore-list check this tick, instead of per-instance
+                # list_tasks/describe_tasks round-trips
+                check_list = [candidate for candidate in pending
+                              if candidate in ci_info
+                              and 0 < ci_info[candidate]['runningTasksCount'] <= len(ignore_list)]
+                task_snapshot = _snapshot_instance_tasks(cluster_name, check_list)
+            if _can_be_terminated(cluster_name, inst, ignore_list, task_snapshot=task_snapshot, ci_info=info):
+                ready.append(inst)
+            else:
+                logging.info("%s: Container Instance %s not ready to be terminated - will try again later", cluster_name, inst)
+                still_pending.append(inst)
+
+        if ready:
+            ready_pairs = []
+            for inst in ready:
+                instance_id = ec2_ids_by_arn.get(inst) or _get_instance_id(cluster_name, inst)
+                if instance_id:
+                    ready_pairs.append((inst, instance_id))
+                else:
+                    logging.error("%s: No EC2 instance ID found for %s - skipping", cluster_name, inst)
+            if asg_name:
+                _terminate_and_remove_batch(cluster_name, [instance_id for _, instance_id in ready_pairs],
+                                            asg_name, dryrun)
+            else:
+                # No ASG name known - fall back to the per-instance terminate
+                for inst, instance_id in ready_pairs:
+                    result = _terminate_and_remove_from_autoscaling_group(cluster_name, inst,
+                                                                          ec2_instance_id=instance_id,
+                                                                          dryrun=dryrun)
+                    logging.info(result)
+
+        pending = still_pending
+        if not pending or dryrun or time.monotonic() + backoff > deadline:
+            break
+        logging.info("%s: %s instance(s) not yet drained - retrying in %s seconds", cluster_name, len(pending), backoff)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+    if pending:
+        logging.info("%s: %s instance(s) not removed - they will be picked up on a subsequent run", cluster_name, len(pending))
 
 
 if __name__ == "__main__":
 
+    # Imported here rather than at module level - boto3 drags in a lot of
+    # service model data that library importers of this module never need
+    import boto3
+
     LOG_FILENAME = 'ecs_cluster_scaledown.log'
 
     parser = argparse.ArgumentParser(description='ecs_cluster_scaledown')
@@ -366,6 +674,8 @@ if __name__ == "__main__":
     parser.add_argument("--instance-ids", help="Instance ID(s) to be removed", dest='instance_ids', nargs='+', required=False)
     parser.add_argument("--ignore-list", help="Tasks to be ignored when determining running tasks", dest='ignore_list', nargs='+',required=False)
     parser.add_argument("--alarm-name", help="Alarm name to check if scale down should be attempted", dest='alarm_name', required=False)
+    parser.add_argument("--drain-wait", help="Seconds to wait for draining instances to empty before giving up [0]",
+                        dest='drain_wait', type=int, default=0, required=False)
     parser.add_argument("--region", help="The AWS region the cluster is in", dest='region', required=True)
     parser.add_argument("--profile", help="The name of an aws cli profile to use.", dest='profile', default=None, required=False)
     parser.add_argument("--verbose", help="Turn on DEBUG logging", action='store_true', required=False)
@@ -391,47 +701,69 @@ if __name__ == "__main__":
     ch.setFormatter(console_formatter)
     file_formatter = logging.Formatter('%(asctime)s - %(levelname)8s: %(message)s')
     fh.setFormatter(file_formatter)
-    # Add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+    # Route records through a queue so the worker threads only pay for an
+    # enqueue - a listener thread does the actual file/console writes
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(log_queue, fh, ch, respect_handler_level=True)
+    log_listener.start()
+    atexit.register(log_listener.stop)
 
     SESSION = boto3.session.Session(profile_name=args.profile, region_name=args.region)
-    ECS = SESSION.client('ecs')
-    EC2 = SESSION.client('ec2')
-    ASG = SESSION.client('autoscaling')
-
-    logging.info('Starting Scale Down Process for cluster: %s' % args.cluster_name)
+    # Larger connection pool so the threaded fan-outs aren't rebuilding TLS
+    # connections, plus keep-alive and adaptive retries for throttling
+    CLIENT_CONFIG = botocore.config.Config(max_pool_connections=64,
+                                           tcp_keepalive=True,
+                                           retries={'max_attempts': 10, 'mode': 'adaptive'})
+    ECS = SESSION.client('ecs', config=CLIENT_CONFIG)
+    EC2 = SESSION.client('ec2', config=CLIENT_CONFIG)
+    ASG = SESSION.client('autoscaling', config=CLIENT_CONFIG)
+
+    logging.info('Starting Scale Down Process for cluster: %s', args.cluster_name)
+
+    # Check the alarm first - a non-alarming run can bail out after a single
+    # CloudWatch call instead of paying for the full cluster walk below
+    if args.count > 0 and args.alarm_name:
+        cw = SESSION.client('cloudwatch', config=CLIENT_CONFIG)
+        logging.debug('Querying for alarm with name %s in ALARM state in the %s region', args.alarm_name, args.region)
+        query_result = cw.describe_alarms(AlarmNames=[args.alarm_name], StateValue='ALARM')
+        # logging.debug(str(query_result))
+        matching_alarms = query_result['MetricAlarms']
+        logging.debug('Found %s alarms in ALARM state', len(matching_alarms))
+        if len(matching_alarms) == 0:
+            logging.warning("Given alarm (%s) is NOT in alarm state - will NOT attempt to scale down cluster", args.alarm_name)
+            sys.exit(0)
 
     # Check for instances in DRAINING state and remove them from the cluster if possible
-    logging.info('%s: Checking for any instances in DRAINING state - if found will attempt to remove them from the cluster' % args.cluster_name)
-    draining_instances = _get_instances_in_cluster(args.cluster_name, status='DRAINING')
-    for instance in draining_instances:
-        remove_container_instance_from_ecs_cluster(cluster_name=args.cluster_name,
-                                                   container_instance_id=instance,
-                                                   ignore_list=args.ignore_list,
-                                                   dryrun=args.dryrun)
+    logging.info('%s: Checking for any instances in DRAINING state - if found will attempt to remove them from the cluster', args.cluster_name)
+    # Probe with a single one-result call first - most runs have nothing
+    # draining and can skip the full paginated walk
+    draining_instances = []
+    if _any_instance_with_status(args.cluster_name, 'DRAINING'):
+        draining_instances = _get_instances_in_cluster(args.cluster_name, status='DRAINING')
+    if draining_instances:
+        draining_set = set(draining_instances)
+        with ThreadPoolExecutor(max_workers=min(16, len(draining_instances))) as executor:
+            list(executor.map(lambda inst: remove_container_instance_from_ecs_cluster(cluster_name=args.cluster_name,
+                                                                                      container_instance_id=inst,
+                                                                                      ignore_list=args.ignore_list,
+                                                                                      dryrun=args.dryrun,
+                                                                                      draining_set=draining_set),
+                              draining_instances))
 
     # providing a count of 0 will simply result in terminating instances is a DRAINING state and not trying to scale down any further
     if args.count > 0:
-        if args.alarm_name:
-            cw = SESSION.client('cloudwatch')
-            logging.debug('Querying for alarm with name %s in ALARM state in the %s region' % (args.alarm_name, args.region))
-            query_result = cw.describe_alarms(AlarmNames=[args.alarm_name], StateValue='ALARM')
-            # logging.debug(str(query_result))
-            matching_alarms = query_result['MetricAlarms']
-            logging.debug('Found %s alarms in ALARM state' % str(len(matching_alarms)))
-            if len(matching_alarms) == 0:
-                logging.warning("Given alarm (%s) is NOT in alarm state - will NOT attempt to scale down cluster" % args.alarm_name)
-                sys.exit(0)
-
         if args.instance_ids:
-            for instance in args.instance_ids:
-                remove_instance_from_ecs_cluster_by_instance_id(cluster_name=args.cluster_name,
-                                                                instance_id=instance,
-                                                                ignore_list=args.ignore_list,
-                                                                dryrun=args.dryrun)
+            # Independent per-instance removals - overlap them like the other fan-outs
+            with ThreadPoolExecutor(max_workers=min(8, len(args.instance_ids))) as executor:
+                list(executor.map(lambda inst: remove_instance_from_ecs_cluster_by_instance_id(cluster_name=args.cluster_name,
+                                                                                               instance_id=inst,
+                                                                                               ignore_list=args.ignore_list,
+                                                                                               dryrun=args.dryrun),
+                                  args.instance_ids))
         else:
             scale_down_ecs_cluster(decrease_count=args.count,
                                    cluster_name=args.cluster_name,
                                    ignore_list=args.ignore_list,
-                                   dryrun=args.dryrun)
+                                   dryrun=args.dryrun,
+                                   drain_wait=args.drain_wait)
@@ -1,107 +1,143 @@
 import logging
 import os
+import re
 import botocore
+import botocore.config
 import boto3
+import heapq
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice
 from operator import itemgetter
 
 logging.getLogger('botocore').setLevel(logging.CRITICAL)
 logging.getLogger('urllib3').setLevel(logging.CRITICAL)
 
+log = logging.getLogger(__name__)
+
+# Bigger connection pool so batched fan-outs reuse warm TLS connections,
+# keep-alive and adaptive retries to absorb API throttling, and timeouts
+# well inside the lambda's own so a hung connection fails fast and retries
+# instead of eating the whole invocation
+CLIENT_CONFIG = botocore.config.Config(max_pool_connections=32,
+                                       tcp_keepalive=True,
+                                       connect_timeout=3,
+                                       read_timeout=15,
+                                       retries={'max_attempts': 10, 'mode': 'adaptive'})
+
+# Lambda containers are reused across invocations - cache the clients per
+# region so warm starts skip session construction and service-model parsing
+# and keep their HTTPS connection pools
+_CLIENT_CACHE = {}
+
+
+def _get_clients(region):
+    """ Return the cached boto3 clients for the given region, building them on first use """
+    clients = _CLIENT_CACHE.get(region)
+    if clients is None:
+        session = boto3.session.Session(region_name=region)
+        clients = {
+            'ecs': session.client('ecs', config=CLIENT_CONFIG),
+            'ec2': session.client('ec2', config=CLIENT_CONFIG),
+            'asg': session.client('autoscaling', config=CLIENT_CONFIG),
+            'cw': session.client('cloudwatch', config=CLIENT_CONFIG)
+        }
+        _CLIENT_CACHE[region] = clients
+    return clients
 
-def _get_instances_in_cluster(ecs, cluster_name, next_token=None, status=None):
-    """Get instances in the given cluster"""
-    result = []
-    if next_token:
-        if status:
-            query_result = ecs.list_container_instances(cluster=cluster_name, nextToken=next_token, status=status)
-        else:
-            query_result = ecs.list_container_instances(cluster=cluster_name, nextToken=next_token)
-    else:
-        if status:
-            query_result = ecs.list_container_instances(cluster=cluster_name, status=status)
-        else:
-            query_result = ecs.list_container_instances(cluster=cluster_name)
-    if 'ResponseMetadata' in query_result:
-        if 'HTTPStatusCode' in query_result['ResponseMetadata']:
-            if query_result['ResponseMetadata']['HTTPStatusCode'] == 200:
-                if 'nextToken' in query_result:
-                    result.extend(query_result['containerInstanceArns'])
-                    result.extend(_get_instances_in_cluster(ecs=ecs,
-                                                            cluster_name=cluster_name,
-                                                            next_token=query_result['nextToken'],
-                                                            status=status))
-                else:
-                    result.extend(query_result['containerInstanceArns'])
-    return result
+
+def _iter_instances_in_cluster(ecs, cluster_name, status=None):
+    """Yield the instance ARNs in the given cluster, one page at a time"""
+    paginator = ecs.get_paginator('list_container_instances')
+    kwargs = {'cluster': cluster_name}
+    if status:
+        kwargs['status'] = status
+    # Full 100-item pages - fewer round-trips than the default page size
+    for page in paginator.paginate(PaginationConfig={'PageSize': 100}, **kwargs):
+        yield from page['containerInstanceArns']
 
 
-def _get_instance_id(ecs, cluster_name, container_instance_id):
-    query_result = ecs.describe_container_instances(cluster=cluster_name, containerInstances=[container_instance_id])
-    instance_id = None
-    if 'containerInstances' in query_result:
-        instance_id = query_result['containerInstances'][0]['ec2InstanceId']
-    return instance_id
+def _get_instances_in_cluster(ecs, cluster_name, status=None):
+    """Get instances in the given cluster"""
+    return list(_iter_instances_in_cluster(ecs, cluster_name, status))
 
 
-def _get_instance_az(ec2, instance_id):
-    query_result = ec2.describe_instances(InstanceIds=[instance_id])
-    az = None
-    if 'Reservations' in query_result:
-        if 'Instances' in query_result['Reservations'][0]:
-            az = query_result['Reservations'][0]['Instances'][0]['Placement']['AvailabilityZone']
-    return az
+def _chunks(item_list, chunk_size):
+    """ Yield successive chunk_size-sized slices from the given list """
+    for i in range(0, len(item_list), chunk_size):
+        yield item_list[i:i + chunk_size]
 
 
 def _get_container_instance_id(ecs, cluster_name, instance_id):
-    query_result = ecs.list_container_instances(cluster=cluster_name)
-    container_instance_id = None
-    for ci in query_result['containerInstanceArns']:
-        if _get_instance_id(ecs, cluster_name, ci) == instance_id:
-            container_instance_id = ci
-    return container_instance_id
-
-
-def _get_autoscaling_group_name(ec2, instance_id):
-    asg_name = None
-    query_result = ec2.describe_instances(InstanceIds=[instance_id])
-    if 'Reservations' in query_result and 'Instances' in query_result['Reservations'][0]:
-        instance_tags = query_result['Reservations'][0]['Instances'][0]['Tags']
-        try:
-            asg_name = [d['Value'] for d in instance_tags if d['Key'] == 'aws:autoscaling:groupName'][0]
-        except:
-            pass
-    return asg_name
+    # The cluster query language can do the matching server-side - one call,
+    # at most one ARN in the response
+    try:
+        query_result = ecs.list_container_instances(cluster=cluster_name,
+                                                    filter=f'ec2InstanceId == {instance_id}')
+        arns = query_result.get('containerInstanceArns', [])
+        if arns:
+            return arns[0]
+    except botocore.exceptions.ClientError as e:
+        log.warning(f'Filtered container instance lookup failed, falling back to a scan: {e}')
+    # Fall back: describe the instances in batches of 100 (the API max) and
+    # match in memory - streaming the listing means we stop paginating as
+    # soon as the match turns up
+    arn_iterator = _iter_instances_in_cluster(ecs, cluster_name)
+    while True:
+        chunk = list(islice(arn_iterator, 100))
+        if not chunk:
+            return None
+        query_result = ecs.describe_container_instances(cluster=cluster_name, containerInstances=chunk)
+        for ci in query_result['containerInstances']:
+            if ci['ec2InstanceId'] == instance_id:
+                return ci['containerInstanceArn']
 
 
 def _get_autoscaling_group_min_size(asg, autoscaling_group_name):
     query_result = asg.describe_auto_scaling_groups(AutoScalingGroupNames=[autoscaling_group_name])
-    if 'AutoScalingGroups' in query_result:
-        return query_result['AutoScalingGroups'][0]['MinSize']
-    else:
+    groups = query_result.get('AutoScalingGroups', [])
+    if not groups:
         return None
-
-
-def _get_instance_task_count(ecs, cluster_name, container_instance_id):
-    number_of_tasks = 0
-    task_list_query_result = ecs.list_tasks(cluster=cluster_name, containerInstance=container_instance_id)
-    if 'taskArns' in task_list_query_result:
-        number_of_tasks = len(task_list_query_result['taskArns'])
-    return number_of_tasks
+    return groups[0]['MinSize']
 
 
 def _get_sorted_instance_list_with_info(ecs, ec2, cluster_name):
     """ Return a list of instance objects in the cluster, ordered by number of tasks running on each """
     cluster_instance_list = _get_instances_in_cluster(ecs, cluster_name, status='ACTIVE')
+
+    # Describe the container instances in chunks of 100 (the API max) rather
+    # than one describe call per instance - the response also carries
+    # runningTasksCount, so no list_tasks calls are needed for the ordering
+    ec2_instance_ids = {}
+    task_counts = {}
+    for chunk in _chunks(cluster_instance_list, 100):
+        query_result = ecs.describe_container_instances(cluster=cluster_name, containerInstances=chunk)
+        for ci in query_result['containerInstances']:
+            ec2_instance_ids[ci['containerInstanceArn']] = ci['ec2InstanceId']
+            task_counts[ci['containerInstanceArn']] = ci['runningTasksCount']
+
+    # Same for the AZs - batched describe_instances instead of one per
+    # instance. The response carries the instance tags too, so the
+    # autoscaling group name comes along for free
+    instance_azs = {}
+    instance_asg_names = {}
+    for chunk in _chunks(list(ec2_instance_ids.values()), 100):
+        query_result = ec2.describe_instances(InstanceIds=chunk)
+        for reservation in query_result.get('Reservations', []):
+            for ec2_instance in reservation['Instances']:
+                instance_azs[ec2_instance['InstanceId']] = ec2_instance['Placement']['AvailabilityZone']
+                instance_asg_names[ec2_instance['InstanceId']] = next(
+                    (tag['Value'] for tag in ec2_instance.get('Tags', [])
+                     if tag['Key'] == 'aws:autoscaling:groupName'), None)
+
     unsorted_instance_list = []
     for instance in cluster_instance_list:
-        number_of_tasks = _get_instance_task_count(ecs, cluster_name, instance)
-        instance_id = _get_instance_id(ecs, cluster_name, instance)
-        instance_az = _get_instance_az(ec2, instance_id)
+        instance_id = ec2_instance_ids.get(instance)
         item = {
             'container_instance_id': instance,
-            'az': instance_az,
-            'task_count': number_of_tasks
+            'az': instance_azs.get(instance_id),
+            'asg_name': instance_asg_names.get(instance_id),
+            'task_count': task_counts.get(instance, 0)
         }
         unsorted_instance_list.append(item)
     sorted_instance_list = sorted(unsorted_instance_list, key=itemgetter('task_count'))
@@ -110,95 +146,90 @@ def _get_sorted_instance_list_with_info(ecs, ec2, cluster_name):
 
 def _start_draining_instances(ecs, cluster_name, container_instance_id_list, dry_run=False):
     """ Put the given instance in a draining state """
-    logging.debug(f"Attempting to put the following container instances in a DRAINING state: {str(container_instance_id_list)}")
+    log.debug("Attempting to put the following container instances in a DRAINING state: %s", container_instance_id_list)
     if not dry_run:
         try:
-            action_result = ecs.update_container_instances_state(cluster=cluster_name,
-                                                                 containerInstances=container_instance_id_list,
-                                                                 status='DRAINING')
-            if 'ResponseMetadata' in action_result:
-                if 'HTTPStatusCode' in action_result['ResponseMetadata']:
-                    if action_result['ResponseMetadata']['HTTPStatusCode'] != 200:
-                        logging.error("Unexpected HTTPStatusCode - Unable to put instances in DRAINING state")
-                        return False
-                else:
-                    logging.error("No HTTPStatusCode in response - Unable to put instances in DRAINING state")
-                    return False
-            else:
-                logging.error("No ResponseMetaData in response - Unable to put instances in DRAINING state")
-                return False
+            # The API caps containerInstances at 10 per call - chunk the list
+            # and fire the chunks concurrently, then aggregate the failures
+            chunk_list = list(_chunks(container_instance_id_list, 10))
+            failures = []
+            with ThreadPoolExecutor(max_workers=min(8, len(chunk_list))) as executor:
+                # botocore raises ClientError on non-2xx responses so there's
+                # no need to inspect ResponseMetadata here
+                futures = [executor.submit(ecs.update_container_instances_state,
+                                           cluster=cluster_name,
+                                           containerInstances=chunk,
+                                           status='DRAINING')
+                           for chunk in chunk_list]
+                for future in as_completed(futures):
+                    failures.extend(future.result().get('failures', []))
             # TODO: Check containerInstances returned and verify instances in question are in DRAINING state
             # If failures list is > 0, print out errors
-            if len(action_result['failures']) > 0:
-                for inst in action_result['failures']:
-                    logging.error(f"Failure putting container instance into DRAINING state: {inst}")
+            if failures:
+                for inst in failures:
+                    log.error(f"Failure putting container instance into DRAINING state: {inst}")
                 return False
             else:
                 return True
         except botocore.exceptions.ClientError as e:
-            logging.error(f'Unexpected error: {e}')
+            log.error(f'Unexpected error: {e}')
     else:
-        logging.warning("   Dry run selected - will NOT put instances into DRAINING state")
+        log.warning("   Dry run selected - will NOT put instances into DRAINING state")
 
 
-def _get_instance_tasks(ecs, cluster_name, container_instance_id, next_token=None):
+def _get_instance_tasks(ecs, cluster_name, container_instance_id):
     """ Get a list of tasks running for the given instance """
+    paginator = ecs.get_paginator('list_tasks')
     result = []
-    if next_token:
-        query_result = ecs.list_tasks(cluster=cluster_name, containerInstance=container_instance_id, nextToken=next_token)
-    else:
-        query_result = ecs.list_tasks(cluster=cluster_name, containerInstance=container_instance_id)
-    if 'ResponseMetadata' in query_result:
-        if 'HTTPStatusCode' in query_result['ResponseMetadata']:
-            if query_result['ResponseMetadata']['HTTPStatusCode'] == 200:
-                if 'nextToken' in query_result:
-                    result.extend(query_result['taskArns'])
-                    result.extend(_get_instance_tasks(ecs=ecs,
-                                                      cluster_name=cluster_name,
-                                                      container_instance_id=container_instance_id,
-                                                      next_token=query_result['nextToken']))
-                else:
-                    result.extend(query_result['taskArns'])
+    for page in paginator.paginate(cluster=cluster_name, containerInstance=container_instance_id,
+                                   PaginationConfig={'PageSize': 100}):
+        result.extend(page['taskArns'])
     return result
 
 
-def _can_be_terminated(ecs, cluster_name, container_instance_id, ignore_list=None):
+def _can_be_terminated(ecs, cluster_name, container_instance_id, ignore_list=None, ci_info=None):
     """
     Determine if the given instance can be terminated
     An instance is deemed ready for termination if no tasks are running on it, or
     only tasks matching the ignore_list are left running on it
+    Callers that already hold the describe_container_instances record pass it
+    as ci_info so the entry check can be answered from runningTasksCount
+    without a list_tasks call
     """
     if ignore_list is None:
         ignore_list = []
-    task_count = _get_instance_task_count(ecs, cluster_name, container_instance_id)
-    if task_count == 0:
-        logging.debug("No tasks running on this instance - can be terminated")
-        return True
-    elif task_count <= len(ignore_list):
-        # There are the same number of tasks as the length of the ignore list - check them
-        logging.debug(f"{cluster_name}: Number of tasks running on this instance equals the length of the ignore list - check tasks to see if they match")
-        task_list = _get_instance_tasks(ecs, cluster_name, container_instance_id)
-        # Double check number of tasks
-        if len(task_list) > len(ignore_list):
-            # Too many tasks
+    if ci_info is not None:
+        running_count = ci_info['runningTasksCount']
+        if running_count == 0:
+            log.debug("No tasks running on this instance - can be terminated")
+            return True
+        if running_count > len(ignore_list):
+            log.warning(f"{cluster_name}: Too many tasks on this instance - can NOT be terminated")
             return False
-        else:
-            query_result = ecs.describe_tasks(cluster=cluster_name,
-                                              tasks=task_list)
-            running_tasks = query_result['tasks']
-            for task in list(running_tasks):
-                for ignore in ignore_list:
-                    if ignore in task['group']:
-                        logging.debug(f'   Found {ignore} task - ignoring')
-                        running_tasks.remove(task)
-                        break
-            # running_tasks should be zero at this point if we can terminate this instance
-            if len(running_tasks) == 0:
-                logging.debug(f"{cluster_name}: All tasks running on this instance in ignore list - can be terminated")
-                return True
+    task_list = _get_instance_tasks(ecs, cluster_name, container_instance_id)
+    if len(task_list) == 0:
+        log.debug("No tasks running on this instance - can be terminated")
+        return True
+    elif len(task_list) <= len(ignore_list):
+        # There are no more tasks than entries in the ignore list - check them
+        log.debug(f"{cluster_name}: Number of tasks running on this instance within the length of the ignore list - check tasks to see if they match")
+        # describe_tasks caps at 100 tasks per request - chunk and flatten
+        described_tasks = []
+        for chunk in _chunks(task_list, 100):
+            query_result = ecs.describe_tasks(cluster=cluster_name, tasks=chunk)
+            described_tasks.extend(query_result['tasks'])
+        # One compiled alternation gives a single scan per group string,
+        # instead of a substring pass per ignore-list entry per task
+        ignore_pattern = re.compile('|'.join(re.escape(ignore) for ignore in ignore_list))
+        running_tasks = [task for task in described_tasks
+                         if not ignore_pattern.search(task['group'])]
+        # running_tasks should be zero at this point if we can terminate this instance
+        if len(running_tasks) == 0:
+            log.debug(f"{cluster_name}: All tasks running on this instance in ignore list - can be terminated")
+            return True
     else:
         # too many tasks
-        logging.warning(f"{cluster_name}: Too many tasks on this instance - can NOT be terminated")
+        log.warning(f"{cluster_name}: Too many tasks on this instance - can NOT be terminated")
         return False
 
 
@@ -208,52 +239,74 @@ def _terminate_and_remove_from_autoscaling_group(ecs, asg, cluster_name, contain
     try:
         query_result = ecs.describe_container_instances(cluster=cluster_name, containerInstances=[container_instance_id])
         result = f'{cluster_name}: Scheduled termination result for container instance {container_instance_id}: '
-        if 'containerInstances' in query_result:
-            instance_id = query_result['containerInstances'][0]['ec2InstanceId']
-            container_instance_state = query_result['containerInstances'][0]['status']
-            logging.debug(f"{cluster_name}: Instance {instance_id} to be terminated - currently in {container_instance_state} state")
+        container_instances = query_result.get('containerInstances', [])
+        if container_instances:
+            instance_id = container_instances[0]['ec2InstanceId']
+            container_instance_state = container_instances[0]['status']
+            log.debug(f"{cluster_name}: Instance {instance_id} to be terminated - currently in {container_instance_state} state")
             if 'DRAINING' not in container_instance_state:
-                logging.warning(f"{cluster_name}: Container Instance not in DRAINING state - unexpected, but continuing anyway")
+                log.warning(f"{cluster_name}: Container Instance not in DRAINING state - unexpected, but continuing anyway")
             if not dry_run:
                 activity_result = asg.terminate_instance_in_auto_scaling_group(InstanceId=instance_id,
                                                                                ShouldDecrementDesiredCapacity=True)
                 result += f"{activity_result['Activity']['StatusCode']}"
             else:
-                logging.warning("Dry run selected - no modifications will be done")
+                log.warning("Dry run selected - no modifications will be done")
                 result += f"Successfully terminated and removed {instance_id} - dry run"
     except botocore.exceptions.ClientError as e:
         result += f'Unexpected error: {e}'
-        logging.error(f'Unexpected error: {e}')
+        log.error(f'Unexpected error: {e}')
     return result
 
 
-def remove_container_instance_from_ecs_cluster(ecs, asg, cluster_name, container_instance_id, ignore_list=None, dry_run=False):
+def remove_container_instance_from_ecs_cluster(ecs, asg, cluster_name, container_instance_id, ignore_list=None,
+                                               dry_run=False, draining_set=None):
     if ignore_list is None:
         ignore_list = []
-    logging.info(f"{cluster_name}: Attempting to remove container instance with ID {container_instance_id} from cluster")
+    log.info(f"{cluster_name}: Attempting to remove container instance with ID {container_instance_id} from cluster")
+
+    # Callers looking up by EC2 instance ID pass None through when the
+    # instance isn't registered in the cluster
+    if container_instance_id is None:
+        log.error(f"{cluster_name}: No container instance found in cluster - aborting")
+        return False
 
     if not dry_run:
+        # One describe up front lets the termination check answer the common
+        # cases (empty, or clearly over-loaded) from runningTasksCount alone
+        query_result = ecs.describe_container_instances(cluster=cluster_name,
+                                                        containerInstances=[container_instance_id])
+        container_instances = query_result.get('containerInstances', [])
+        ci_info = container_instances[0] if container_instances else None
+
         # Make sure instance in question is in DRAINING state before continuing
-        if container_instance_id not in _get_instances_in_cluster(ecs, cluster_name, status='DRAINING'):
-            logging.error(f"{cluster_name}: Container Instance {container_instance_id} not in DRAINING state - aborting")
+        # Callers removing several instances pass the DRAINING set in so we
+        # don't re-list the cluster per instance; otherwise the status on the
+        # describe above already answers it
+        if draining_set is not None:
+            in_draining_state = container_instance_id in draining_set
+        else:
+            in_draining_state = ci_info is not None and ci_info['status'] == 'DRAINING'
+        if not in_draining_state:
+            log.error(f"{cluster_name}: Container Instance {container_instance_id} not in DRAINING state - aborting")
             return False
 
-        if _can_be_terminated(ecs, cluster_name, container_instance_id, ignore_list):
+        if _can_be_terminated(ecs, cluster_name, container_instance_id, ignore_list, ci_info=ci_info):
             result = _terminate_and_remove_from_autoscaling_group(ecs, asg, cluster_name, container_instance_id, dry_run)
-            logging.info(result)
+            log.info(result)
             return True
         else:
-            logging.info(f"{cluster_name}: Container Instance {container_instance_id} not ready to be terminated - will try again later")
+            log.info(f"{cluster_name}: Container Instance {container_instance_id} not ready to be terminated - will try again later")
             return False
     else:
-        logging.warning("   Dry run selected - don't terminate and remove...")
+        log.warning("   Dry run selected - don't terminate and remove...")
         return True
 
 
 def remove_instance_from_ecs_cluster_by_instance_id(ecs, asg, cluster_name, instance_id, ignore_list=None, dry_run=False):
     if ignore_list is None:
         ignore_list = []
-    logging.info(f"{cluster_name}: Asked to remove instance with ID {instance_id} from cluster")
+    log.info(f"{cluster_name}: Asked to remove instance with ID {instance_id} from cluster")
     container_instance_id = _get_container_instance_id(ecs, cluster_name, instance_id)
     return remove_container_instance_from_ecs_cluster(ecs=ecs,
                                                       asg=asg,
@@ -278,44 +331,56 @@ def scale_down_ecs_cluster(ecs, ec2, asg, decrease_count, cluster_name=None, ign
     if ignore_list is None:
         ignore_list = []
     if not cluster_name:
-        logging.critical("Must provide cluster name")
-    logging.info(f"{cluster_name}: Asked to scale down cluster by a count of {str(decrease_count)}")
+        log.critical("Must provide cluster name")
+    log.info(f"{cluster_name}: Asked to scale down cluster by a count of {str(decrease_count)}")
+    # One cheap describe gives the cluster size before any instance walking -
+    # an empty cluster can never scale down. A single-instance cluster falls
+    # through to the real ASG minimum-size check below, which can be 0
+    query_result = ecs.describe_clusters(clusters=[cluster_name])
+    clusters = query_result.get('clusters', [])
+    if not clusters:
+        log.error(f"{cluster_name}: Cluster not found! Aborting")
+        return False
+    if clusters[0]['registeredContainerInstancesCount'] == 0:
+        log.error(f"{cluster_name}: No instances in cluster! Aborting")
+        return False
     # Get an ordered list of instances in the cluster
     ordered_instances = _get_sorted_instance_list_with_info(ecs=ecs, ec2=ec2, cluster_name=cluster_name)
     container_instance_list = []
     for instance in ordered_instances:
         container_instance_list.append(instance['container_instance_id'])
-    logging.debug(f"{cluster_name}: Cluster instance list: {json.dumps(ordered_instances)}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s: Cluster instance list: %s", cluster_name, json.dumps(ordered_instances))
     instance_count = len(container_instance_list)
     if instance_count <= 0:
-        logging.error(f"{cluster_name}: No instances in cluster! Aborting")
+        log.error(f"{cluster_name}: No instances in cluster! Aborting")
         return False
 
-    # Query an instance in the cluster for the Autoscaling Group Name
-    instance_to_query = _get_instance_id(ecs, cluster_name, container_instance_list[0])
-    asg_name = _get_autoscaling_group_name(ec2, instance_to_query)
+    # The ordering pass already read the aws:autoscaling:groupName tag from
+    # its batched describe - no extra API calls to find the group name
+    asg_name = ordered_instances[0]['asg_name']
     if asg_name:
         min_cluster_size = int(_get_autoscaling_group_min_size(asg, asg_name))
-        logging.info(f"{cluster_name}: Determined minimum cluster size to be {str(min_cluster_size)}")
+        log.info(f"{cluster_name}: Determined minimum cluster size to be {str(min_cluster_size)}")
     else:
-        logging.warning(f"{cluster_name}: Unable to determine minimum cluster size, defaulting to 1")
+        log.warning(f"{cluster_name}: Unable to determine minimum cluster size, defaulting to 1")
         min_cluster_size = 1
 
     if instance_count <= min_cluster_size:
-        logging.error(f"{cluster_name}: Cluster is already at or below minimum size - aborting")
+        log.error(f"{cluster_name}: Cluster is already at or below minimum size - aborting")
         return False
 
     if instance_count - decrease_count < min_cluster_size:
         # need to recalculate decrease_count
-        logging.warning(f"{cluster_name}: Decreasing cluster by the given count, {decrease_count}, would result in cluster dropping below minimum size")
+        log.warning(f"{cluster_name}: Decreasing cluster by the given count, {decrease_count}, would result in cluster dropping below minimum size")
         decrease_count = instance_count - min_cluster_size
-        logging.warning(f"{cluster_name}: Cluster min size is {min_cluster_size}, current size is {instance_count}, can decrease by a maximum of {decrease_count}")
+        log.warning(f"{cluster_name}: Cluster min size is {min_cluster_size}, current size is {instance_count}, can decrease by a maximum of {decrease_count}")
 
     if decrease_count <= 0:
-        logging.error(f"{cluster_name}: Not enough instances in cluster to reduce size")
+        log.error(f"{cluster_name}: Not enough instances in cluster to reduce size")
         return False
 
-    logging.info(f"{cluster_name}: Current cluster size: {instance_count}")
+    log.info(f"{cluster_name}: Current cluster size: {instance_count}")
 
     # Determine number of instances in each az
     azs = {}
@@ -325,48 +390,46 @@ def scale_down_ecs_cluster(ecs, ec2, asg, decrease_count, cluster_name=None, ign
             azs[az_name] = []
         azs[az_name].append(instance['container_instance_id'])
 
-    logging.debug(f"AZ dict: {json.dumps(azs)}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("AZ dict: %s", json.dumps(azs))
 
     for az in azs:
-        logging.info(f"   Count in {az}: {len(azs[az])}")
+        log.info(f"   Count in {az}: {len(azs[az])}")
 
+    # Always take the next instance from the AZ with the most instances left so
+    # the zones stay balanced - a max-heap on AZ size handles any number of AZs
     terminate_list = []
-    # Only handle 2 AZs for now
-    if len(azs) == 1:
-        # only one availability zone in use - just remove the top entry
-        logging.debug(f'{cluster_name}: Only one availability zone in play - select the least loaded instance')
-        terminate_list = container_instance_list[:decrease_count]
-    elif len(azs) == 2:
-        az_names = []
-        for az in azs:
-            az_names.append(az)
-        for x in range(0, decrease_count):
-            # two availability zones in use
-            if len(azs[az_names[0]]) > len(azs[az_names[1]]) or len(azs[az_names[0]]) == len(azs[az_names[1]]):
-                # first group is greater than or equal to the second group - first take from group 1
-                instance_to_terminate = azs[az_names[0]].pop(0)
-                logging.debug(f'{cluster_name}: Selecting instance from AZ: {az_names[0]}')
-                terminate_list.append(instance_to_terminate)
-            else:
-                # first group is smaller than the second group - first take from group 2
-                instance_to_terminate = azs[az_names[1]].pop(0)
-                logging.debug(f'{cluster_name}:` Selecting instance from AZ: {az_names[1]}')
-                terminate_list.append(instance_to_terminate)
-    else:
-        logging.error(f"{cluster_name}: Can't handle more than 2 availability zones currently")
-        return
-
-    logging.debug(f"{cluster_name}: Terminate instance list: {terminate_list}")
+    az_heap = [(-len(instances), az, instances) for az, instances in azs.items()]
+    heapq.heapify(az_heap)
+    for x in range(0, decrease_count):
+        size, az, instances = heapq.heappop(az_heap)
+        log.debug(f'{cluster_name}: Selecting instance from AZ: {az}')
+        terminate_list.append(instances.pop(0))
+        if instances:
+            heapq.heappush(az_heap, (-len(instances), az, instances))
+
+    log.debug("%s: Terminate instance list: %s", cluster_name, terminate_list)
     # Drain the least loaded instances
     _start_draining_instances(ecs, cluster_name, terminate_list, dry_run)
 
-    for inst in terminate_list[:]:
-        remove_container_instance_from_ecs_cluster(ecs=ecs,
-                                                   asg=asg,
-                                                   cluster_name=cluster_name,
-                                                   container_instance_id=inst,
-                                                   ignore_list=ignore_list,
-                                                   dry_run=dry_run)
+    # Each removal is an independent chain of API calls - fan them out and
+    # collect the outcomes as they finish
+    removed_count = 0
+    with ThreadPoolExecutor(max_workers=min(16, len(terminate_list))) as executor:
+        futures = [executor.submit(remove_container_instance_from_ecs_cluster,
+                                   ecs=ecs,
+                                   asg=asg,
+                                   cluster_name=cluster_name,
+                                   container_instance_id=inst,
+                                   ignore_list=ignore_list,
+                                   dry_run=dry_run)
+                   for inst in terminate_list]
+        for future in as_completed(futures):
+            if future.result():
+                removed_count += 1
+    if removed_count < len(terminate_list):
+        log.info(f"{cluster_name}: removed {removed_count} of {len(terminate_list)} instance(s) - "
+                     "the rest will be picked up on a subsequent run")
 
 
 def lambda_handler(event, context):
@@ -377,7 +440,7 @@ def lambda_handler(event, context):
         logging_level = logging.INFO
     logging.getLogger().setLevel(logging_level)
 
-    logging.debug(f'Event: {event}')
+    log.debug('Event: %s', event)
     cluster_name = event.get('cluster_name', None)
     count = event.get('count', 1)
     instance_ids = event.get('instance_ids', None)
@@ -387,53 +450,59 @@ def lambda_handler(event, context):
     dry_run = event.get('dry_run', False)
 
     if not cluster_name or not region:
-        logging.critical("Must provide cluster name and region - aborting")
+        log.critical("Must provide cluster name and region - aborting")
         return
 
-    session = boto3.session.Session(region_name=region)
-    ecs_client = session.client('ecs')
-    ec2_client = session.client('ec2')
-    asg_client = session.client('autoscaling')
+    clients = _get_clients(region)
+    ecs_client = clients['ecs']
+    ec2_client = clients['ec2']
+    asg_client = clients['asg']
 
-    logging.info(f'Starting Scale Down Process for cluster: {cluster_name}')
+    log.info(f'Starting Scale Down Process for cluster: {cluster_name}')
 
     # First check for instances in DRAINING state and remove them from the cluster if possible
-    logging.info(f'{cluster_name}: Checking for any instances in DRAINING state')
+    log.info(f'{cluster_name}: Checking for any instances in DRAINING state')
     draining_instances = _get_instances_in_cluster(ecs_client, cluster_name, status='DRAINING')
     if len(draining_instances) > 0:
-        logging.info(f'{cluster_name}: found {len(draining_instances)} instances in DRAINING state - removing')
-        for instance in draining_instances:
-            remove_container_instance_from_ecs_cluster(ecs=ecs_client,
-                                                       asg=asg_client,
-                                                       cluster_name=cluster_name,
-                                                       container_instance_id=instance,
-                                                       ignore_list=ignore_list,
-                                                       dry_run=dry_run)
+        log.info(f'{cluster_name}: found {len(draining_instances)} instances in DRAINING state - removing')
+        # Independent per-instance removals - overlap the network waits, and
+        # share the DRAINING set we just fetched instead of re-listing per call
+        draining_set = frozenset(draining_instances)
+        with ThreadPoolExecutor(max_workers=min(16, len(draining_instances))) as executor:
+            list(executor.map(lambda inst: remove_container_instance_from_ecs_cluster(ecs=ecs_client,
+                                                                                      asg=asg_client,
+                                                                                      cluster_name=cluster_name,
+                                                                                      container_instance_id=inst,
+                                                                                      ignore_list=ignore_list,
+                                                                                      dry_run=dry_run,
+                                                                                      draining_set=draining_set),
+                              draining_instances))
     else:
-        logging.info(f'{cluster_name}: no instances found in DRAINING state')
+        log.info(f'{cluster_name}: no instances found in DRAINING state')
 
     # providing a count of 0 will simply result in terminating instances that
     # are in a DRAINING state and not trying to scale down any further
     if count > 0:
         if alarm_name:
-            cw_client = session.client('cloudwatch')
-            logging.debug(f'Querying for alarm with name {alarm_name} in ALARM state in the {region} region')
+            cw_client = clients['cw']
+            log.debug(f'Querying for alarm with name {alarm_name} in ALARM state in the {region} region')
             query_result = cw_client.describe_alarms(AlarmNames=[alarm_name], StateValue='ALARM')
-            # logging.debug(str(query_result))
+            # log.debug(str(query_result))
             matching_alarms = query_result.get('MetricAlarms')
-            logging.debug(f'Found {len(matching_alarms)} alarms in ALARM state')
+            log.debug(f'Found {len(matching_alarms)} alarms in ALARM state')
             if len(matching_alarms) == 0:
-                logging.warning(f"Given alarm ({alarm_name}) NOT in alarm state - NOT attempting scale down of cluster")
+                log.warning(f"Given alarm ({alarm_name}) NOT in alarm state - NOT attempting scale down of cluster")
                 return
 
         if instance_ids:
-            for instance in instance_ids:
-                remove_instance_from_ecs_cluster_by_instance_id(ecs=ecs_client,
-                                                                asg=asg_client,
-                                                                cluster_name=cluster_name,
-                                                                instance_id=instance,
-                                                                ignore_list=ignore_list,
-                                                                dry_run=dry_run)
+            with ThreadPoolExecutor(max_workers=min(16, len(instance_ids))) as executor:
+                list(executor.map(lambda inst: remove_instance_from_ecs_cluster_by_instance_id(ecs=ecs_client,
+                                                                                               asg=asg_client,
+                                                                                               cluster_name=cluster_name,
+                                                                                               instance_id=inst,
+                                                                                               ignore_list=ignore_list,
+                                                                                               dry_run=dry_run),
+                                  instance_ids))
         else:
             scale_down_ecs_cluster(ecs=ecs_client,
                                    ec2=ec2_client,